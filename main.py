@@ -6,6 +6,14 @@ import random
 import string
 import math
 import datetime
+import threading
+import bisect
+import queue
+import copy
+import uuid
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from functools import wraps
 from pathlib import Path
 
@@ -29,8 +37,15 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "ersetzen_durch_einen_geheimen_schluessel")
 
+# umask lässt sich nur durch Setzen auslesen – daher einmalig beim Import, solange noch keine Threads laufen
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 CSV_FILE_PATH = "abrechnungen.csv"
 PRICES_JSON_PATH = "Preise.json"
+REPORTS_DIR = "berichte"
+CASH_LOG_PATH = "kassenbuch.csv"
+CASH_STATE_PATH = "kasse.json"
 
 with open(PRICES_JSON_PATH, "r", encoding="utf-8") as f:
     price_data = json.load(f)
@@ -63,29 +78,53 @@ def load_config() -> dict:
     return DEFAULT_CFG
 
 
-def atomic_write_json(path: pathlib.Path, data: dict):
+def make_temp_file(path, mode=None):
+    """
+    Legt neben path eine temporäre Datei an. mkstemp erzeugt sie mit 0600,
+    ohne mode werden die Rechte wie bei einem normalen open() an die umask angepasst.
+    """
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".__", suffix=".tmp")
+    os.close(tmp_fd)
+    os.chmod(tmp_path, mode if mode is not None else 0o666 & ~UMASK)
+    return tmp_path
+
+
+def fsync_file(path):
+    """Stellt sicher, dass der Inhalt von path auf dem Datenträger liegt."""
+    with open(path, "rb+") as f:
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_file_atomic(path, write_func, mode=None, backup=None):
     """
-    Schreibt JSON erst in eine temporäre Datei und ersetzt
-    das Original dann atomisch. Damit bleibt das alte File intakt,
-    falls der Schreibvorgang abbricht.
+    Ruft write_func mit einem temporären Pfad auf und ersetzt das Ziel erst
+    danach atomisch. Damit bleibt das alte File intakt, falls der Schreibvorgang
+    abbricht, und Leser sehen nie eine halb geschriebene Datei.
+    Mit backup wird die bisherige Datei vorher dorthin kopiert.
     """
-    tmp_fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".__cfg_", suffix=".tmp")
+    tmp_path = make_temp_file(path, mode)
     try:
-        with open(tmp_fd, "w", encoding="utf-8") as tmp_file:
-            json.dump(data, tmp_file, ensure_ascii=False, indent=2)
-            tmp_file.flush()          # sicherstellen, dass alles im Puffer ist
-            os.fsync(tmp_file.fileno())
+        write_func(tmp_path)
+        fsync_file(tmp_path)      # erst auf Platte, dann umbenennen – sonst droht nach Absturz eine leere Datei
         # Backup der aktuellen Datei anlegen
-        if path.exists():
-            shutil.copy2(path, CONFIG_BAK)
+        if backup and os.path.exists(path):
+            shutil.copy2(path, backup)
         # Jetzt das temp-File atomisch verschieben
-        os.replace(tmp_name, path)
+        os.replace(tmp_path, path)
     finally:
         # Falls etwas schiefging, temporäre Datei entsorgen
-        try:
-            os.unlink(tmp_name)
-        except FileNotFoundError:
-            pass
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_json(path, data, mode=None, backup=None):
+    """Schreibt JSON atomisch über write_file_atomic."""
+    def write_json(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    write_file_atomic(path, write_json, mode=mode, backup=backup)
 
 def handle_token_refresh(token: str | None):
     """
@@ -104,7 +143,7 @@ def handle_token_refresh(token: str | None):
     # alles gut → Konfiguration aktualisieren
     config["APIKEY"] = token
     try:
-        atomic_write_json(CONFIG_PATH, config)        # Funktion aus vorheriger Antwort
+        atomic_write_json(CONFIG_PATH, config, mode=0o600, backup=CONFIG_BAK)   # enthält den API-Schlüssel
         logging.info("Token-Refresh: Neuer Schlüssel gespeichert.")
     except Exception:
         logging.exception("Token-Refresh: Konnte config.json nicht schreiben – behalte alten Wert.")
@@ -172,34 +211,42 @@ def invoice_number_exists(invoice_number):
 
 
 def write_to_csv(data_dict):
-    file_exists = os.path.exists(CSV_FILE_PATH)
-    with open(CSV_FILE_PATH, "a", newline="", encoding="utf-8-sig") as f:
-        fieldnames = [
-            "datum",
-            "rechnungsnummer",
-            "name",
-            "mitgliedsstatus",
-            "zahlungsmethode",
-            "bezahlter_betrag",
-            "berechneter_gesamtpreis",
-            "spendenbetrag",
-            "positionen",
-            "notiz"
-        ]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(data_dict)
-
-
-def generate_pdf_receipt(data_dict, effective_datetime_obj):
+    # Unter index_lock, damit ein gleichzeitiger Indexaufbau die Zeile nicht doppelt aufnimmt
+    with index_lock:
+        file_exists = os.path.exists(CSV_FILE_PATH)
+        with open(CSV_FILE_PATH, "a", newline="", encoding="utf-8-sig") as f:
+            fieldnames = [
+                "datum",
+                "rechnungsnummer",
+                "name",
+                "mitgliedsstatus",
+                "zahlungsmethode",
+                "bezahlter_betrag",
+                "berechneter_gesamtpreis",
+                "spendenbetrag",
+                "positionen",
+                "notiz"
+            ]
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            if not file_exists:
+                writer.writeheader()
+            writer.writerow(data_dict)
+        # Solange der Index noch nicht aufgebaut ist, übernimmt der Aufbau die Zeile aus der CSV
+        if ledger_index["built"]:
+            _index_add(data_dict)
+    invalidate_reports(data_dict["datum"])
+
+
+def generate_pdf_receipt(data_dict, effective_datetime_obj, beleg_template=None):
     """
     Erzeugt einen PDF-Beleg anhand der Eintragsdaten und einer Vorlage aus beleg.json.
     Der PDF-Name basiert auf dem aktuellen Zeitstempel.
+    Die Datei wird atomisch ersetzt, ein Download sieht nie einen halb geschriebenen Beleg.
     """
     # Lade die Vorlage
-    with open("beleg.json", "r", encoding="utf-8") as f:
-        beleg_template = json.load(f)
+    if beleg_template is None:
+        with open("beleg.json", "r", encoding="utf-8") as f:
+            beleg_template = json.load(f)
 
     # Erstelle einen Dateinamen anhand des Zeitstempels
     #data_dict.get('datum')
@@ -208,7 +255,12 @@ def generate_pdf_receipt(data_dict, effective_datetime_obj):
     pdf_filename = os.path.join("pdfs", f"{timestamp}.pdf")
     os.makedirs("pdfs", exist_ok=True)
 
-    c = canvas.Canvas(pdf_filename, pagesize=A4)
+    write_file_atomic(pdf_filename, lambda tmp: _draw_pdf_receipt(tmp, data_dict, beleg_template))
+    return pdf_filename
+
+
+def _draw_pdf_receipt(path, data_dict, beleg_template):
+    c = canvas.Canvas(path, pagesize=A4)
     width, height = A4
 
     # HEADER
@@ -267,7 +319,6 @@ def generate_pdf_receipt(data_dict, effective_datetime_obj):
 
     c.showPage()
     c.save()
-    return pdf_filename
 
 
 @app.route("/abrechnungen.csv")
@@ -396,6 +447,9 @@ def index():
             "notiz": notiz
         }
         write_to_csv(data_dict)
+        publish_ledger_change("neu", data_dict)
+        if zahlungsmethode.lower() == "bar":
+            record_cash_event("einnahme", bezahlter_betrag, eintrag=data_dict["datum"])
 
         # PDF-Beleg generieren
         pdf_file = generate_pdf_receipt(data_dict, effective_datetime_obj)
@@ -567,6 +621,7 @@ def admin():
 
     return render_template(
         "admin.html",
+        kasse=get_cash_state(),
         from_date=from_date.strftime("%Y-%m-%d"),
         to_date=to_date.strftime("%Y-%m-%d"),
         bar_entries=bar_entries,
@@ -604,35 +659,53 @@ def delete_entry():
 
     # 1. CSV neu schreiben ohne den zu löschenden Eintrag
     entries = []
-    if os.path.exists(CSV_FILE_PATH):
-        with open(CSV_FILE_PATH, "r", encoding="utf-8-sig") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["datum"] != timestamp:
-                    entries.append(row)
-
-    # Überschreibe Datei
-    with open(CSV_FILE_PATH, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "datum",
-            "rechnungsnummer",
-            "name",
-            "mitgliedsstatus",
-            "zahlungsmethode",
-            "bezahlter_betrag",
-            "berechneter_gesamtpreis",
-            "spendenbetrag",
-            "positionen",
-            "notiz"
-        ])
-        writer.writeheader()
-        writer.writerows(entries)
+    removed = []
+
+    # Überschreibe Datei atomisch, damit gleichzeitige Leser (Berichte, Suchindex) nie eine halbe CSV sehen
+    def write_entries(path):
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=[
+                "datum",
+                "rechnungsnummer",
+                "name",
+                "mitgliedsstatus",
+                "zahlungsmethode",
+                "bezahlter_betrag",
+                "berechneter_gesamtpreis",
+                "spendenbetrag",
+                "positionen",
+                "notiz"
+            ])
+            writer.writeheader()
+            writer.writerows(entries)
+
+    # Unter index_lock, damit weder write_to_csv noch der Indexaufbau dazwischenfunken
+    with index_lock:
+        if os.path.exists(CSV_FILE_PATH):
+            with open(CSV_FILE_PATH, "r", encoding="utf-8-sig") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if row["datum"] != timestamp:
+                        entries.append(row)
+                    else:
+                        removed.append(row)
+
+        write_file_atomic(CSV_FILE_PATH, write_entries)
+        if ledger_index["built"]:
+            _index_remove(timestamp)
 
     # 2. PDF löschen (falls vorhanden)
     pdf_path = os.path.join("pdfs", pdf_name)
     if os.path.exists(pdf_path):
         os.remove(pdf_path)
 
+    if removed:
+        invalidate_reports(timestamp)
+        for row in removed:
+            publish_ledger_change("geloescht", row)
+            if row.get("zahlungsmethode", "").lower() == "bar":
+                record_cash_storno(row)
+
     flash(f"Eintrag vom {timestamp} wurde gelöscht.", "success")
     return redirect(url_for("admin"))
 
@@ -723,6 +796,868 @@ def reupload_invoice():
     return redirect(request.referrer or url_for("admin"))
 
 
+### Monats- und Jahresberichte ###
+# Pro Monat wird eine Aggregation (berichte/JJJJ-MM.json) zwischengespeichert.
+# Jahresberichte werden aus den zwölf Monatsaggregaten zusammengesetzt.
+# Neue oder gelöschte Einträge verwerfen nur den Cache ihres Monats/Jahres,
+# abgeschlossene Zeiträume werden also nie neu berechnet.
+REPORT_PERIOD_PATTERN = re.compile(r"^\d{4}(-(0[1-9]|1[0-2]))?$")
+REPORT_FORMATS = ("csv", "pdf")
+reports_lock = threading.Lock()
+
+
+def parse_betrag(value):
+    try:
+        return float(str(value or "0").replace(",", ".").replace("€", "").strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+def parse_positionen(positionen_text):
+    """
+    Zerlegt das CSV-Feld "positionen" ("Gerät x Menge => Betrag€; ...")
+    in eine Liste von (Gerätename, Betrag).
+    """
+    result = []
+    if not positionen_text or positionen_text == "Keine Positionen":
+        return result
+    for pos in positionen_text.split("; "):
+        if "=>" not in pos:
+            continue
+        name_menge, betrag_str = pos.rsplit("=>", 1)
+        gerätename = name_menge.rsplit(" x ", 1)[0].strip()
+        if gerätename:
+            result.append((gerätename, parse_betrag(betrag_str)))
+    return result
+
+
+def get_kategorien_map():
+    return {
+        eintrag["name"]: eintrag.get("kategorie", "").strip() or "Sonstiges"
+        for eintrag in price_data
+    }
+
+
+def _report_paths(periode):
+    return [os.path.join(REPORTS_DIR, f"{periode}.{ext}") for ext in ("json",) + REPORT_FORMATS]
+
+
+def invalidate_reports(datum_str):
+    """
+    Verwirft die zwischengespeicherten Berichte für den Monat und das Jahr
+    des angegebenen Eintrags ("TT.MM.JJJJ HH:MM:SS").
+    """
+    try:
+        dt = datetime.datetime.strptime(datum_str, "%d.%m.%Y %H:%M:%S")
+    except (TypeError, ValueError):
+        return
+    with reports_lock:
+        for periode in (dt.strftime("%Y-%m"), dt.strftime("%Y")):
+            for path in _report_paths(periode):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _empty_aggregate():
+    return {"anzahl": 0, "spenden": 0.0, "zahlungsarten": {}, "kategorien": {}, "geraete": {}}
+
+
+def _add_entry_to_aggregate(agg, row, kategorien_map):
+    nutzung = parse_betrag(row.get("berechneter_gesamtpreis"))
+    spende = parse_betrag(row.get("spendenbetrag"))
+    methode = (row.get("zahlungsmethode") or "").strip() or "Unbekannt"
+
+    agg["anzahl"] += 1
+    agg["spenden"] += spende
+    zahlungsart = agg["zahlungsarten"].setdefault(methode, {"anzahl": 0, "nutzung": 0.0, "spenden": 0.0})
+    zahlungsart["anzahl"] += 1
+    zahlungsart["nutzung"] += nutzung
+    zahlungsart["spenden"] += spende
+
+    for gerätename, betrag in parse_positionen(row.get("positionen", "")):
+        agg["geraete"][gerätename] = agg["geraete"].get(gerätename, 0) + 1
+        kategorie = kategorien_map.get(gerätename, "Sonstiges")
+        agg["kategorien"][kategorie] = agg["kategorien"].get(kategorie, 0.0) + betrag
+
+
+def _merge_aggregate(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict):
+            _merge_aggregate(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def load_month_aggregates(months):
+    """
+    Liefert die Aggregate der angegebenen Monate ("JJJJ-MM").
+    Fehlende Monate werden in einem einzigen Durchlauf über die CSV berechnet
+    und anschließend im Cache abgelegt. Muss unter reports_lock laufen.
+    """
+    aggregates = {}
+    missing = set()
+    for month in months:
+        try:
+            with open(os.path.join(REPORTS_DIR, f"{month}.json"), "r", encoding="utf-8") as f:
+                aggregates[month] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            missing.add(month)
+
+    if not missing:
+        return aggregates
+
+    computed = {month: _empty_aggregate() for month in missing}
+    kategorien_map = get_kategorien_map()
+    if os.path.exists(CSV_FILE_PATH):
+        with open(CSV_FILE_PATH, "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                try:
+                    dt = datetime.datetime.strptime(row["datum"], "%d.%m.%Y %H:%M:%S")
+                except Exception:
+                    continue
+                month = dt.strftime("%Y-%m")
+                if month in computed:
+                    _add_entry_to_aggregate(computed[month], row, kategorien_map)
+
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    for month, agg in computed.items():
+        atomic_write_json(os.path.join(REPORTS_DIR, f"{month}.json"), agg)
+        aggregates[month] = agg
+    return aggregates
+
+
+def _report_sections(agg):
+    """Bereitet die Tabellen eines Berichts für CSV und PDF gleichermaßen auf."""
+    zahlungsarten = []
+    summe_nutzung = summe_spenden = 0.0
+    for methode, werte in sorted(agg["zahlungsarten"].items()):
+        summe_nutzung += werte["nutzung"]
+        summe_spenden += werte["spenden"]
+        zahlungsarten.append([methode, werte["anzahl"], f"{werte['nutzung']:.2f}",
+                              f"{werte['spenden']:.2f}", f"{werte['nutzung'] + werte['spenden']:.2f}"])
+    zahlungsarten.append(["Summe", agg["anzahl"], f"{summe_nutzung:.2f}",
+                          f"{summe_spenden:.2f}", f"{summe_nutzung + summe_spenden:.2f}"])
+
+    kategorien = [[k, f"{v:.2f}"] for k, v in sorted(agg["kategorien"].items())]
+    kategorien.append(["Spenden", f"{agg['spenden']:.2f}"])
+    geraete = [[g, n] for g, n in sorted(agg["geraete"].items(), key=lambda x: (-x[1], x[0]))]
+
+    return [
+        ("Zahlungsarten", ["Zahlungsart", "Anzahl", "Nutzungsgebühren", "Spenden", "Gesamt"], zahlungsarten),
+        ("Kategorien", ["Kategorie", "Betrag"], kategorien),
+        ("Geräte", ["Gerät", "Anzahl Nutzungen"], geraete),
+    ]
+
+
+def _write_report_csv(path, periode, agg):
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Bericht", periode])
+        for titel, header, rows in _report_sections(agg):
+            writer.writerow([])
+            writer.writerow([titel])
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+def _write_report_pdf(path, periode, agg):
+    c = canvas.Canvas(path, pagesize=A4)
+    width, height = A4
+    y = height - 50
+
+    c.setFont("Helvetica-Bold", 22)
+    c.drawCentredString(width / 2, y, f"Abrechnungsbericht {periode}")
+    c.setLineWidth(1)
+    c.line(50, y - 10, width - 50, y - 10)
+    y -= 50
+
+    for titel, header, rows in _report_sections(agg):
+        if y < 120:
+            c.showPage()
+            y = height - 50
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, y, titel)
+        y -= 20
+        col_width = (width - 100) / len(header)
+        for i, line in enumerate([header] + rows):
+            if y < 50:
+                c.showPage()
+                y = height - 50
+            c.setFont("Helvetica-Bold" if i == 0 else "Helvetica", 10)
+            for col, value in enumerate(line):
+                x = 50 + col * col_width
+                if col == 0:
+                    c.drawString(x, y, str(value))
+                else:
+                    c.drawRightString(x + col_width, y, str(value))
+            y -= 15
+        y -= 20
+
+    c.showPage()
+    c.save()
+
+
+def get_report(periode, fmt):
+    """
+    Liefert den Pfad zum Bericht ("JJJJ" oder "JJJJ-MM") im gewünschten Format.
+    Ist der Bericht bereits im Cache, wird er nicht neu erzeugt.
+    """
+    path = os.path.join(REPORTS_DIR, f"{periode}.{fmt}")
+    with reports_lock:
+        if os.path.exists(path):
+            return path
+
+        if len(periode) == 4:
+            months = [f"{periode}-{m:02d}" for m in range(1, 13)]
+        else:
+            months = [periode]
+        agg = _empty_aggregate()
+        for month_agg in load_month_aggregates(months).values():
+            _merge_aggregate(agg, month_agg)
+
+        if fmt == "csv":
+            write_file_atomic(path, lambda tmp: _write_report_csv(tmp, periode, agg))
+        else:
+            write_file_atomic(path, lambda tmp: _write_report_pdf(tmp, periode, agg))
+    return path
+
+
+@app.route("/admin/bericht")
+@requires_auth
+def download_report():
+    periode = request.args.get("periode", "").strip()
+    fmt = request.args.get("format", "pdf").strip().lower()
+
+    if not REPORT_PERIOD_PATTERN.fullmatch(periode) or fmt not in REPORT_FORMATS:
+        flash("Ungültiger Zeitraum oder Format für den Bericht.", "error")
+        return redirect(url_for("admin"))
+
+    path = get_report(periode, fmt)
+    return send_file(
+        path,
+        mimetype="text/csv" if fmt == "csv" else "application/pdf",
+        as_attachment=True,
+        download_name=f"bericht_{periode}.{fmt}"
+    )
+
+
+### Volltextsuche über die Abrechnungen ###
+# Invertierter Index über name, notiz, positionen und rechnungsnummer.
+# Er wird beim ersten Zugriff einmal aus der CSV aufgebaut und danach von
+# write_to_csv und delete_entry fortgeschrieben.
+SEARCH_FIELDS = ("name", "notiz", "positionen", "rechnungsnummer")
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+")
+SEARCH_DEFAULT_LIMIT = 100
+index_lock = threading.Lock()
+ledger_index = {
+    "built": False,
+    "next_id": 0,
+    "entries": {},      # id -> Zeile inkl. "dt" und "pdf_filename"
+    "postings": {},     # Token -> Menge von ids
+    "days": {},         # Datum -> Menge von ids
+    "datum": {},        # "TT.MM.JJJJ HH:MM:SS" -> Menge von ids
+    "tokens": [],       # sortierte Tokens für die Präfixsuche
+    "tokens_dirty": False,
+}
+
+
+def tokenize(text):
+    return SEARCH_TOKEN_PATTERN.findall((text or "").lower())
+
+
+def _index_add(row):
+    """Fügt eine Zeile in den Index ein. Muss unter index_lock laufen."""
+    try:
+        dt = datetime.datetime.strptime(row["datum"], "%d.%m.%Y %H:%M:%S")
+    except Exception:
+        return
+
+    entry_id = ledger_index["next_id"]
+    ledger_index["next_id"] += 1
+    entry = dict(row)
+    entry["dt"] = dt
+    entry["pdf_filename"] = dt.strftime("%d%m%Y%H%M%S") + ".pdf"
+    ledger_index["entries"][entry_id] = entry
+    ledger_index["days"].setdefault(dt.date(), set()).add(entry_id)
+    ledger_index["datum"].setdefault(row["datum"], set()).add(entry_id)
+
+    for field in SEARCH_FIELDS:
+        for token in tokenize(row.get(field)):
+            postings = ledger_index["postings"].get(token)
+            if postings is None:
+                postings = ledger_index["postings"][token] = set()
+                ledger_index["tokens_dirty"] = True
+            postings.add(entry_id)
+
+
+def ensure_ledger_index():
+    """Baut den Index einmalig aus der CSV auf. Muss unter index_lock laufen."""
+    if ledger_index["built"]:
+        return
+    if os.path.exists(CSV_FILE_PATH):
+        with open(CSV_FILE_PATH, "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                _index_add(row)
+    ledger_index["built"] = True
+
+
+def _index_remove(datum_str):
+    """Entfernt alle Einträge mit diesem Zeitstempel. Muss unter index_lock laufen."""
+    for entry_id in ledger_index["datum"].pop(datum_str, set()):
+        entry = ledger_index["entries"].pop(entry_id)
+        day_ids = ledger_index["days"].get(entry["dt"].date())
+        if day_ids is not None:
+            day_ids.discard(entry_id)
+            if not day_ids:
+                del ledger_index["days"][entry["dt"].date()]
+        for field in SEARCH_FIELDS:
+            for token in tokenize(entry.get(field)):
+                postings = ledger_index["postings"].get(token)
+                if postings is None:
+                    continue
+                postings.discard(entry_id)
+                if not postings:
+                    del ledger_index["postings"][token]
+                    ledger_index["tokens_dirty"] = True
+
+
+def _ids_for_prefix(prefix):
+    """Alle ids, deren Tokens mit prefix beginnen. Muss unter index_lock laufen."""
+    if ledger_index["tokens_dirty"]:
+        ledger_index["tokens"] = sorted(ledger_index["postings"])
+        ledger_index["tokens_dirty"] = False
+    tokens = ledger_index["tokens"]
+    ids = set()
+    i = bisect.bisect_left(tokens, prefix)
+    while i < len(tokens) and tokens[i].startswith(prefix):
+        ids |= ledger_index["postings"][tokens[i]]
+        i += 1
+    return ids
+
+
+def search_ledger(query, from_date=None, to_date=None, zahlungsmethode=None, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Sucht Einträge, die alle Suchbegriffe (als Wortanfang) enthalten.
+    Optional wird nach Zeitraum und Zahlungsmethode gefiltert.
+    Liefert (Trefferanzahl, neueste Treffer bis limit).
+    """
+    with index_lock:
+        ensure_ledger_index()
+
+        candidates = None
+        for term in set(tokenize(query)):
+            ids = _ids_for_prefix(term)
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return 0, []
+
+        if from_date or to_date:
+            day_ids = set()
+            for day, ids in ledger_index["days"].items():
+                if (not from_date or day >= from_date) and (not to_date or day <= to_date):
+                    day_ids |= ids
+            candidates = day_ids if candidates is None else candidates & day_ids
+        if candidates is None:
+            candidates = ledger_index["entries"].keys()
+
+        results = [ledger_index["entries"][i] for i in candidates]
+        if zahlungsmethode:
+            results = [e for e in results if e.get("zahlungsmethode", "").lower() == zahlungsmethode.lower()]
+        results.sort(key=lambda e: e["dt"], reverse=True)
+        return len(results), [{k: v for k, v in e.items() if k != "dt"} for e in results[:limit]]
+
+
+@app.route("/admin/suche")
+@requires_auth
+def search_entries():
+    query = request.args.get("q", "").strip()
+    zahlungsmethode = request.args.get("zahlungsmethode", "").strip()
+    try:
+        from_date = datetime.datetime.strptime(request.args["from"], "%Y-%m-%d").date() if request.args.get("from") else None
+        to_date = datetime.datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else None
+        limit = int(request.args.get("limit", SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Ungültiger Zeitraum oder ungültiges Limit."}), 400
+    if limit < 1:
+        return jsonify({"error": "Das Limit muss mindestens 1 sein."}), 400
+
+    anzahl, ergebnisse = search_ledger(query, from_date, to_date, zahlungsmethode, limit)
+    return jsonify({"anzahl": anzahl, "ergebnisse": ergebnisse})
+
+
+### Live-Aktualisierung des Admin-Bereichs (Server-Sent Events) ###
+# Einfaches Publish/Subscribe im Prozess: Jeder geöffnete Admin-Bereich
+# abonniert eine Queue, Abrechnung und Löschen veröffentlichen die Änderung.
+EVENT_QUEUE_SIZE = 100
+EVENT_KEEPALIVE_SECONDS = 15
+event_subscribers = set()
+events_lock = threading.Lock()
+
+
+def subscribe_events():
+    q = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+    with events_lock:
+        event_subscribers.add(q)
+    return q
+
+
+def unsubscribe_events(q):
+    with events_lock:
+        event_subscribers.discard(q)
+
+
+def is_subscribed(q):
+    with events_lock:
+        return q in event_subscribers
+
+
+def publish_event(event, data):
+    with events_lock:
+        subscribers = list(event_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait((event, data))
+        except queue.Full:
+            # Client liest nicht mehr mit – abmelden statt den Server zu blockieren.
+            # Der zugehörige Stream bemerkt das und beendet sich (siehe admin_events).
+            logging.warning("SSE: Abonnent reagiert nicht, wird entfernt.")
+            unsubscribe_events(q)
+
+
+def daily_totals(day):
+    """Summen je Zahlungsmethode für einen Tag, berechnet aus dem Suchindex."""
+    totals = {}
+    with index_lock:
+        ensure_ledger_index()
+        for entry_id in ledger_index["days"].get(day, ()):
+            entry = ledger_index["entries"][entry_id]
+            methode = entry.get("zahlungsmethode", "").lower() or "unbekannt"
+            summe = totals.setdefault(methode, {"anzahl": 0, "nutzung": 0.0, "spenden": 0.0, "gesamt": 0.0})
+            summe["anzahl"] += 1
+            summe["nutzung"] += parse_betrag(entry.get("berechneter_gesamtpreis"))
+            summe["spenden"] += parse_betrag(entry.get("spendenbetrag"))
+    for summe in totals.values():
+        summe["nutzung"] = round(summe["nutzung"], 2)
+        summe["spenden"] = round(summe["spenden"], 2)
+        summe["gesamt"] = round(summe["nutzung"] + summe["spenden"], 2)
+    return totals
+
+
+def todays_totals_payload():
+    today = datetime.date.today()
+    return {"heute": today.isoformat(), "tagessummen": daily_totals(today)}
+
+
+def publish_ledger_change(event, row):
+    """
+    Veröffentlicht einen neuen ("neu") oder gelöschten ("geloescht") Eintrag.
+    "tag" ist das Datum des Eintrags, die Tagessummen beziehen sich immer auf heute.
+    """
+    if not event_subscribers:
+        return
+    try:
+        dt = datetime.datetime.strptime(row["datum"], "%d.%m.%Y %H:%M:%S")
+    except Exception:
+        return
+    eintrag = dict(row)
+    eintrag["pdf_filename"] = dt.strftime("%d%m%Y%H%M%S") + ".pdf"
+    publish_event(event, {
+        "eintrag": eintrag,
+        "tag": dt.date().isoformat(),
+        **todays_totals_payload(),
+    })
+
+
+@app.route("/admin/events")
+@requires_auth
+def admin_events():
+    def stream():
+        q = subscribe_events()
+        try:
+            today = datetime.date.today()
+            yield "retry: 5000\n\n"
+            yield f"event: tagessummen\ndata: {json.dumps(todays_totals_payload())}\n\n"
+            while True:
+                # Wurde der Abonnent wegen voller Queue entfernt, Stream beenden –
+                # EventSource verbindet sich dann neu und holt den aktuellen Stand
+                if not is_subscribed(q):
+                    return
+                try:
+                    event, data = q.get(timeout=EVENT_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Nach Mitternacht die (leeren) Summen des neuen Tages schicken
+                    if datetime.date.today() != today:
+                        today = datetime.date.today()
+                        yield f"event: tagessummen\ndata: {json.dumps(todays_totals_payload())}\n\n"
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        finally:
+            unsubscribe_events(q)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+### Kassenbuch (Bargeld-Bestand) ###
+# Der erwartete Kassenbestand ("soll") wird bei jeder Barzahlung, jedem
+# gelöschten Bar-Eintrag und jeder Entnahme fortgeschrieben. Eine Zählung
+# hält die Differenz zum Soll fest und setzt das Soll auf den gezählten Betrag.
+# Alle Ereignisse landen zusätzlich in kassenbuch.csv; bei Einnahmen und
+# Stornos steht dort in "notiz" der Zeitstempel des Abrechnungseintrags.
+CASH_LOG_FIELDS = ["datum", "art", "betrag", "soll", "notiz"]
+cash_lock = threading.Lock()
+cash_state = None
+# Zeitstempel der seit der letzten Zählung gebuchten Bar-Einträge -> Anzahl Buchungen.
+# Nur im Speicher, damit kasse.json und der gemeldete Kassenstand fest klein bleiben.
+cash_open_entries = None
+
+
+def _empty_cash_state():
+    return {
+        "soll": 0.0,
+        "letzte_zaehlung": None,
+        "seit_zaehlung": {"einnahmen": 0.0, "stornos": 0.0, "entnahmen": 0.0},
+    }
+
+
+def _load_cash_open_entries():
+    """
+    Baut cash_open_entries einmalig aus kassenbuch.csv auf (Einnahmen minus
+    Stornos seit der letzten Zählung). Muss unter cash_lock laufen.
+    """
+    global cash_open_entries
+    if cash_open_entries is None:
+        cash_open_entries = {}
+        if os.path.exists(CASH_LOG_PATH):
+            with open(CASH_LOG_PATH, "r", encoding="utf-8-sig") as f:
+                for row in csv.DictReader(f):
+                    if row["art"] == "zaehlung":
+                        cash_open_entries = {}
+                    elif row["art"] == "einnahme":
+                        _add_open_entry(row["notiz"], 1)
+                    elif row["art"] == "storno":
+                        _add_open_entry(row["notiz"], -1)
+    return cash_open_entries
+
+
+def _add_open_entry(eintrag, delta):
+    anzahl = cash_open_entries.get(eintrag, 0) + delta
+    if anzahl > 0:
+        cash_open_entries[eintrag] = anzahl
+    else:
+        cash_open_entries.pop(eintrag, None)
+
+
+def _load_cash_state():
+    """Lädt den Kassenstand einmalig aus kasse.json. Muss unter cash_lock laufen."""
+    global cash_state
+    if cash_state is None:
+        try:
+            with open(CASH_STATE_PATH, "r", encoding="utf-8") as f:
+                cash_state = json.load(f)
+        except FileNotFoundError:
+            cash_state = _empty_cash_state()
+        except json.JSONDecodeError as e:
+            logging.error("kasse.json defekt (%s) – beginne mit leerem Kassenstand.", e)
+            cash_state = _empty_cash_state()
+        cash_state.pop("einnahmen_seit_zaehlung", None)   # ältere kasse.json führte die Liste noch mit
+    return cash_state
+
+
+def get_cash_state():
+    with cash_lock:
+        return copy.deepcopy(_load_cash_state())
+
+
+def _book_cash_event(art, betrag, notiz="", eintrag=None):
+    """
+    Verbucht ein Kassenereignis ("einnahme", "storno", "entnahme" oder "zaehlung")
+    und liefert eine Kopie des neuen Kassenstands. Bei einer Zählung ist betrag der
+    gezählte Bestand. eintrag ist der Zeitstempel des zugehörigen Abrechnungseintrags.
+    Muss unter cash_lock laufen.
+    """
+    betrag = round(float(betrag), 2)
+    now = datetime.datetime.now().strftime("%d.%m.%Y %H:%M:%S")
+    state = _load_cash_state()
+    _load_cash_open_entries()
+    seit = state["seit_zaehlung"]
+    if art == "einnahme":
+        state["soll"] += betrag
+        seit["einnahmen"] += betrag
+        _add_open_entry(eintrag, 1)
+    elif art == "storno":
+        state["soll"] -= betrag
+        seit["stornos"] += betrag
+        _add_open_entry(eintrag, -1)
+    elif art == "entnahme":
+        state["soll"] -= betrag
+        seit["entnahmen"] += betrag
+    elif art == "zaehlung":
+        state["letzte_zaehlung"] = {
+            "datum": now,
+            "gezaehlt": betrag,
+            "soll": round(state["soll"], 2),
+            "differenz": round(betrag - state["soll"], 2),
+        }
+        state["soll"] = betrag
+        state["seit_zaehlung"] = {"einnahmen": 0.0, "stornos": 0.0, "entnahmen": 0.0}
+        cash_open_entries.clear()
+    else:
+        raise ValueError(f"Unbekannte Kassenbuchung: {art}")
+    state["soll"] = round(state["soll"], 2)
+    for key in state["seit_zaehlung"]:
+        state["seit_zaehlung"][key] = round(state["seit_zaehlung"][key], 2)
+
+    file_exists = os.path.exists(CASH_LOG_PATH)
+    with open(CASH_LOG_PATH, "a", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=CASH_LOG_FIELDS)
+        if not file_exists:
+            writer.writeheader()
+        writer.writerow({"datum": now, "art": art, "betrag": f"{betrag:.2f}",
+                         "soll": f"{state['soll']:.2f}", "notiz": notiz or eintrag or ""})
+    atomic_write_json(CASH_STATE_PATH, state)
+    return copy.deepcopy(state)
+
+
+def record_cash_event(art, betrag, notiz="", eintrag=None):
+    with cash_lock:
+        result = _book_cash_event(art, betrag, notiz, eintrag)
+    publish_event("kasse", result)
+    return result
+
+
+def record_cash_storno(row):
+    """
+    Bucht einen gelöschten Bar-Eintrag aus der Kasse aus. Entscheidend ist, wann
+    die Einnahme gebucht wurde, nicht das (evtl. rückdatierte) Datum des Eintrags:
+    Wurde sie vor der letzten Zählung gebucht, ist sie in deren Differenz bereits
+    enthalten und ändert das Soll nicht mehr.
+    """
+    betrag = parse_betrag(row.get("bezahlter_betrag"))
+    with cash_lock:
+        if row.get("datum") not in _load_cash_open_entries():
+            logging.info("Kasse: Einnahme %s wurde vor der letzten Zählung gebucht – Soll bleibt unverändert.",
+                         row.get("datum"))
+            return
+        result = _book_cash_event("storno", betrag, eintrag=row["datum"])
+    publish_event("kasse", result)
+
+
+@app.route("/admin/kasse")
+@requires_auth
+def cash_status():
+    return jsonify(get_cash_state())
+
+
+@app.route("/admin/kasse/<art>", methods=["POST"])
+@requires_auth
+def cash_booking(art):
+    if art not in ("zaehlung", "entnahme"):
+        flash("Unbekannte Kassenbuchung.", "error")
+        return redirect(url_for("admin"))
+    try:
+        betrag = float(request.form.get("betrag", "").replace(",", "."))
+    except ValueError:
+        betrag = -1
+    if not math.isfinite(betrag) or betrag < 0 or (art == "entnahme" and betrag == 0):
+        flash("Ungültiger Betrag.", "error")
+        return redirect(request.referrer or url_for("admin"))
+
+    state = record_cash_event(art, betrag, request.form.get("notiz", "").strip())
+    if art == "zaehlung":
+        differenz = state["letzte_zaehlung"]["differenz"]
+        flash(f"Zählung gespeichert: {betrag:.2f} €, Differenz zum Soll: {differenz:+.2f} €.",
+              "success" if differenz == 0 else "warning")
+    else:
+        flash(f"Entnahme von {betrag:.2f} € gespeichert. Neues Soll: {state['soll']:.2f} €.", "success")
+    return redirect(request.referrer or url_for("admin"))
+
+
+### Belege für einen Zeitraum neu erzeugen ###
+# Liest die CSV einmal, verteilt die PDF-Erzeugung über einen Prozesspool auf
+# alle CPU-Kerne und meldet den Fortschritt per /admin/belege-neu/<id> und SSE.
+regeneration_jobs = {}
+regeneration_lock = threading.Lock()
+
+
+REGENERATION_EVENT_INTERVAL = 1.0  # Sekunden zwischen zwei Fortschrittsmeldungen per SSE
+
+
+def _render_receipt(row, beleg_template):
+    """
+    Läuft im Worker-Prozess: erzeugt einen Beleg in einer temporären Datei und
+    liefert (temporärer Pfad, Zielpfad). Ersetzt wird erst im Hauptprozess.
+    """
+    dt = datetime.datetime.strptime(row["datum"], "%d.%m.%Y %H:%M:%S")
+    pdf_filename = os.path.join("pdfs", dt.strftime("%d%m%Y%H%M%S") + ".pdf")
+    os.makedirs("pdfs", exist_ok=True)
+    tmp_path = make_temp_file(pdf_filename)
+    try:
+        _draw_pdf_receipt(tmp_path, row, beleg_template)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, pdf_filename
+
+
+def _install_receipt(datum_str, tmp_path, pdf_filename):
+    """
+    Ersetzt den Beleg atomisch, sofern der Eintrag noch existiert. Unter index_lock,
+    damit ein gleichzeitig gelöschter Eintrag nicht wieder einen Beleg bekommt.
+    """
+    try:
+        with index_lock:
+            ensure_ledger_index()
+            if datum_str not in ledger_index["datum"]:
+                return False
+            os.replace(tmp_path, pdf_filename)
+            return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _update_regeneration_job(job, publish=True, **changes):
+    with regeneration_lock:
+        job.update(changes)
+        snapshot = copy.deepcopy(job)
+    if publish:
+        publish_event("belege", snapshot)
+
+
+def _run_regeneration_job(job, rows, beleg_template):
+    fertig = fehler = uebersprungen = 0
+    last_event = 0.0
+    try:
+        # "spawn" statt "fork", da der Flask-Prozess bereits Threads laufen hat
+        with ProcessPoolExecutor(max_workers=os.cpu_count() or 1,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_render_receipt, row, beleg_template): row for row in rows}
+            for future in as_completed(futures):
+                datum_str = futures[future]["datum"]
+                try:
+                    if _install_receipt(datum_str, *future.result()):
+                        fertig += 1
+                    else:
+                        uebersprungen += 1
+                except Exception:
+                    fehler += 1
+                    logging.error("Beleg für %s konnte nicht erzeugt werden.", datum_str, exc_info=True)
+                # Fortschritt höchstens einmal pro Intervall melden, um die SSE-Queues nicht zu fluten
+                now = time.monotonic()
+                publish = now - last_event >= REGENERATION_EVENT_INTERVAL
+                if publish:
+                    last_event = now
+                _update_regeneration_job(job, publish, fertig=fertig, fehler=fehler, uebersprungen=uebersprungen)
+        _update_regeneration_job(job, status="fertig")
+    except Exception:
+        logging.exception("Neuerzeugung der Belege abgebrochen.")
+        _update_regeneration_job(job, status="fehlgeschlagen")
+
+
+def _regeneration_running():
+    return any(job["status"] == "laeuft" for job in regeneration_jobs.values())
+
+
+def _load_beleg_template():
+    """Liest beleg.json für die Neuerzeugung ein. Wirft ValueError, wenn die Vorlage ungültig ist."""
+    try:
+        with open("beleg.json", "r", encoding="utf-8") as f:
+            beleg_template = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"beleg.json ist ungültig: {e}") from e
+    if not isinstance(beleg_template, dict):
+        raise ValueError("beleg.json ist ungültig: Es wird ein JSON-Objekt erwartet.")
+    return beleg_template
+
+
+def start_regeneration_job(from_date, to_date):
+    """
+    Startet die Neuerzeugung aller Belege im Zeitraum im Hintergrund.
+    Liefert den Auftrag oder None, falls bereits ein Auftrag läuft.
+    Wirft ValueError, wenn beleg.json ungültig ist – der Auftrag wird dann gar nicht erst angelegt.
+    """
+    with regeneration_lock:
+        if _regeneration_running():
+            return None
+
+    # Vorlage und Einträge vor dem Anlegen des Auftrags lesen, damit ein Fehler hier
+    # keinen Auftrag im Zustand "laeuft" zurücklässt
+    beleg_template = _load_beleg_template()
+    rows = []
+    if os.path.exists(CSV_FILE_PATH):
+        with open(CSV_FILE_PATH, "r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                try:
+                    dt = datetime.datetime.strptime(row["datum"], "%d.%m.%Y %H:%M:%S")
+                except Exception:
+                    continue
+                if from_date <= dt.date() <= to_date:
+                    rows.append(row)
+
+    with regeneration_lock:
+        if _regeneration_running():
+            return None
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "von": from_date.isoformat(),
+            "bis": to_date.isoformat(),
+            "status": "laeuft",
+            "gesamt": len(rows),
+            "fertig": 0,
+            "fehler": 0,
+            "uebersprungen": 0,
+        }
+        regeneration_jobs[job["id"]] = job
+
+    try:
+        if not rows:
+            _update_regeneration_job(job, status="fertig")
+        else:
+            _update_regeneration_job(job)
+            threading.Thread(target=_run_regeneration_job, args=(job, rows, beleg_template), daemon=True).start()
+    except Exception:
+        _update_regeneration_job(job, status="fehlgeschlagen")
+        raise
+    return job
+
+
+@app.route("/admin/belege-neu", methods=["POST"])
+@requires_auth
+def regenerate_receipts():
+    try:
+        from_date = datetime.datetime.strptime(request.form.get("from", ""), "%Y-%m-%d").date()
+        to_date = datetime.datetime.strptime(request.form.get("to", ""), "%Y-%m-%d").date()
+    except ValueError:
+        flash("Ungültiger Zeitraum für die Neuerzeugung.", "error")
+        return redirect(request.referrer or url_for("admin"))
+
+    try:
+        job = start_regeneration_job(from_date, to_date)
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(request.referrer or url_for("admin"))
+    if job is None:
+        flash("Es läuft bereits eine Neuerzeugung von Belegen.", "error")
+    else:
+        flash(f"Neuerzeugung von {job['gesamt']} Belegen gestartet (Auftrag {job['id']}).", "info")
+    return redirect(request.referrer or url_for("admin"))
+
+
+@app.route("/admin/belege-neu/<job_id>")
+@requires_auth
+def regeneration_status(job_id):
+    with regeneration_lock:
+        job = copy.deepcopy(regeneration_jobs.get(job_id))
+    if job is None:
+        return jsonify({"error": "Auftrag nicht gefunden."}), 404
+    return jsonify(job)
+
+
 ### Route zum Download einer PDF ###
 @app.route("/download/<filename>")
 @requires_auth
@@ -0,0 +1,157 @@
+/*
+  In diesem Script:
+  - Verbindung zum SSE-Stream (/admin/events) für die Live-Aktualisierung.
+  - Neue Abrechnungen im gewählten Zeitraum werden in die passende Tabelle eingefügt,
+    gelöschte Einträge entfernt und die Summen entsprechend angepasst.
+  - Die Tagessummen von heute werden im Live-Bereich angezeigt.
+  - Der Kassenbestand wird nach jeder Kassenbuchung aktualisiert.
+  - Der Fortschritt einer Neuerzeugung von Belegen wird angezeigt.
+*/
+
+const container = document.getElementById("admin-container");
+const rowTemplate = document.getElementById("entry-row-template");
+
+document.addEventListener("DOMContentLoaded", () => {
+  if (!window.EventSource || !container) {
+    return;
+  }
+  const source = new EventSource(container.dataset.eventsUrl);
+  const status = document.getElementById("live-status");
+
+  source.addEventListener("open", () => {
+    status.textContent = "live";
+    status.classList.add("online");
+  });
+  source.addEventListener("error", () => {
+    status.textContent = "offline";
+    status.classList.remove("online");
+  });
+
+  source.addEventListener("tagessummen", (e) => {
+    updateLivePanel(JSON.parse(e.data));
+  });
+  source.addEventListener("neu", (e) => {
+    const data = JSON.parse(e.data);
+    updateLivePanel(data);
+    if (isInFilterRange(data.tag)) {
+      insertEntryRow(data.eintrag);
+      adjustSums(data.eintrag, 1);
+    }
+  });
+  source.addEventListener("kasse", (e) => {
+    updateCashPanel(JSON.parse(e.data));
+  });
+  source.addEventListener("belege", (e) => {
+    updateRegenerationStatus(JSON.parse(e.data));
+  });
+  source.addEventListener("geloescht", (e) => {
+    const data = JSON.parse(e.data);
+    updateLivePanel(data);
+    if (removeEntryRows(data.eintrag.datum)) {
+      adjustSums(data.eintrag, -1);
+    }
+  });
+});
+
+function updateLivePanel(data) {
+  // Jedes Ereignis bringt die Summen des aktuellen Tages mit ("heute"), auch über Mitternacht hinweg
+  const summen = data.tagessummen || {};
+  document.getElementById("live-tag").textContent = formatDate(data.heute);
+  document.getElementById("live-bar").textContent = ((summen.bar || {}).gesamt || 0).toFixed(2);
+  document.getElementById("live-karte").textContent = ((summen.karte || {}).gesamt || 0).toFixed(2);
+}
+
+function updateCashPanel(kasse) {
+  document.getElementById("kasse-soll").textContent = kasse.soll.toFixed(2);
+  document.getElementById("kasse-einnahmen").textContent = kasse.seit_zaehlung.einnahmen.toFixed(2);
+  document.getElementById("kasse-stornos").textContent = kasse.seit_zaehlung.stornos.toFixed(2);
+  document.getElementById("kasse-entnahmen").textContent = kasse.seit_zaehlung.entnahmen.toFixed(2);
+  const zaehlung = kasse.letzte_zaehlung;
+  if (zaehlung) {
+    const differenz = (zaehlung.differenz >= 0 ? "+" : "") + zaehlung.differenz.toFixed(2);
+    document.getElementById("kasse-zaehlung").textContent =
+      `Letzte Zählung am ${zaehlung.datum}: ${zaehlung.gezaehlt.toFixed(2)} € (Differenz ${differenz} €)`;
+  }
+}
+
+function updateRegenerationStatus(job) {
+  const status = { laeuft: "läuft", fertig: "fertig", fehlgeschlagen: "fehlgeschlagen" }[job.status] || job.status;
+  const fehler = job.fehler ? `, ${job.fehler} Fehler` : "";
+  const uebersprungen = job.uebersprungen ? `, ${job.uebersprungen} gelöscht` : "";
+  document.getElementById("belege-status").textContent =
+    `Belege ${job.fertig}/${job.gesamt}${fehler}${uebersprungen} – ${status}`;
+}
+
+function isInFilterRange(tag) {
+  return container.dataset.from <= tag && tag <= container.dataset.to;
+}
+
+function groupPrefix(eintrag) {
+  const methode = (eintrag.zahlungsmethode || "").toLowerCase();
+  if (methode === "bar") return "bar";
+  if (methode === "karte") return "card";
+  return null;
+}
+
+function insertEntryRow(eintrag) {
+  const prefix = groupPrefix(eintrag);
+  if (!prefix || !rowTemplate) {
+    return;
+  }
+  const row = rowTemplate.content.firstElementChild.cloneNode(true);
+  row.dataset.datum = eintrag.datum;
+  row.querySelector(".col-datum").textContent = eintrag.datum;
+  row.querySelector(".col-name").textContent = eintrag.name;
+  row.querySelector(".col-rechnungsnummer").textContent = eintrag.rechnungsnummer || "-";
+  row.querySelector(".col-nutzung").textContent = eintrag.berechneter_gesamtpreis;
+  row.querySelector(".col-bezahlt").textContent = eintrag.bezahlter_betrag;
+
+  const link = row.querySelector(".col-download");
+  link.href = link.dataset.base + encodeURIComponent(eintrag.pdf_filename);
+  link.textContent = eintrag.pdf_filename.slice(0, -4);
+
+  row.querySelectorAll("input[name='timestamp']").forEach((input) => { input.value = eintrag.datum; });
+  row.querySelectorAll("input[name='rechnungsnummer']").forEach((input) => { input.value = eintrag.rechnungsnummer || ""; });
+
+  row.classList.add("live-new");
+  document.getElementById(`${prefix}-entries`).appendChild(row);
+}
+
+function removeEntryRows(datum) {
+  let removed = false;
+  document.querySelectorAll("#bar-entries tr, #card-entries tr").forEach((row) => {
+    if (row.dataset.datum === datum) {
+      row.remove();
+      removed = true;
+    }
+  });
+  return removed;
+}
+
+function adjustSums(eintrag, sign) {
+  const prefix = groupPrefix(eintrag);
+  if (!prefix) {
+    return;
+  }
+  const usage = parseAmount(eintrag.berechneter_gesamtpreis) * sign;
+  const spenden = parseAmount(eintrag.spendenbetrag) * sign;
+  addToSpan(`${prefix}-usage`, usage);
+  addToSpan(`${prefix}-spenden`, spenden);
+  addToSpan(`${prefix}-total`, usage + spenden);
+}
+
+function addToSpan(id, delta) {
+  const span = document.getElementById(id);
+  if (span) {
+    span.textContent = (parseAmount(span.textContent) + delta).toFixed(2);
+  }
+}
+
+function parseAmount(value) {
+  return parseFloat(String(value || "0").replace(",", ".")) || 0;
+}
+
+function formatDate(isoDate) {
+  const [jahr, monat, tag] = isoDate.split("-");
+  return `${tag}.${monat}.${jahr}`;
+}